@@ -1,11 +1,12 @@
 from __future__ import annotations
 
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
 import numpy as np
 import PIL
 import torch
 from transformers import Owlv2ForObjectDetection, Owlv2Processor
+from transformers.models.owlv2.modeling_owlv2 import Owlv2ObjectDetectionOutput
 
 from datadreamer.dataset_annotation.image_annotator import BaseAnnotator
 from datadreamer.dataset_annotation.utils import apply_tta
@@ -17,33 +18,55 @@ class OWLv2Annotator(BaseAnnotator):
     detection.
 
     Attributes:
+        model_id (str): The Hugging Face Hub id of the OWLv2 checkpoint.
         model (Owlv2ForObjectDetection): The OWLv2 model for object detection.
         processor (Owlv2Processor): The processor for the OWLv2 model.
         device (str): The device on which the model will run ('cuda' for GPU, 'cpu' for CPU).
+        use_fp16 (bool): Whether the model runs in float16 on CUDA devices.
+        dtype (torch.dtype): The dtype of the model, float16 if use_fp16 is set and the device is CUDA, float32 otherwise.
+        use_torch_compile (bool): Whether the model is compiled with torch.compile.
+        use_cuda_graphs (bool): Whether the forward pass is captured and replayed as a CUDA graph.
 
     Methods:
         _init_model(): Initializes the OWLv2 model.
         _init_processor(): Initializes the processor for the OWLv2 model.
+        _capture_cuda_graph(inputs): Captures the forward pass of the model as a CUDA graph.
+        _forward(inputs): Runs the forward pass of the model.
         annotate_batch(image, prompts, conf_threshold, use_tta, synonym_dict): Annotates the given image with bounding boxes and labels.
         release(empty_cuda_cache): Releases resources and optionally empties the CUDA cache.
     """
 
+    model_id = "google/owlv2-base-patch16-ensemble"
+
     def __init__(
         self,
         seed: float = 42,
         device: str = "cuda",
+        use_torch_compile: bool = False,
+        use_cuda_graphs: bool = False,
+        use_fp16: bool = False,
     ) -> None:
         """Initializes the OWLv2Annotator with a specific seed and device.
 
         Args:
             seed (float): Seed for reproducibility. Defaults to 42.
             device (str): The device to run the model on. Defaults to 'cuda'.
+            use_torch_compile (bool): Whether to compile the model with torch.compile. Defaults to False.
+            use_cuda_graphs (bool): Whether to replay the forward pass as a CUDA graph on CUDA devices. Defaults to False.
+            use_fp16 (bool): Whether to run the model in float16 on CUDA devices. Defaults to False.
         """
         super().__init__(seed)
         self.model = self._init_model()
         self.processor = self._init_processor()
         self.device = device
-        self.model.to(self.device)
+        self.use_fp16 = use_fp16
+        self.dtype = self._get_dtype()
+        self.use_torch_compile = use_torch_compile
+        self.model.to(self.device, self.dtype)
+        if self.use_torch_compile:
+            self.model = torch.compile(self.model, mode="reduce-overhead")
+        self.use_cuda_graphs = use_cuda_graphs
+        self._reset_cuda_graph()
 
     def _init_model(self):
         """Initializes the OWLv2 model for object detection.
@@ -51,9 +74,17 @@ class OWLv2Annotator(BaseAnnotator):
         Returns:
             Owlv2ForObjectDetection: The initialized OWLv2 model.
         """
-        return Owlv2ForObjectDetection.from_pretrained(
-            "google/owlv2-base-patch16-ensemble"
-        )
+        return Owlv2ForObjectDetection.from_pretrained(self.model_id)
+
+    def _get_dtype(self) -> torch.dtype:
+        """Returns the dtype to run the model with on its device.
+
+        Returns:
+            torch.dtype: float16 if use_fp16 is set and the device is CUDA, float32 otherwise.
+        """
+        if self.use_fp16 and torch.device(self.device).type == "cuda":
+            return torch.float16
+        return torch.float32
 
     def _init_processor(self):
         """Initializes the processor for the OWLv2 model.
@@ -62,9 +93,69 @@ class OWLv2Annotator(BaseAnnotator):
             Owlv2Processor: The initialized processor.
         """
         return Owlv2Processor.from_pretrained(
-            "google/owlv2-base-patch16-ensemble", do_pad=False, do_resize=False
+            self.model_id, do_pad=False, do_resize=False
         )
 
+    def _reset_cuda_graph(self) -> None:
+        """Drops the captured CUDA graph and its static buffers."""
+        self._cuda_graph = None
+        self._static_inputs = None
+        self._static_outputs = None
+
+    def _capture_cuda_graph(self, inputs: Dict[str, torch.Tensor]) -> None:
+        """Captures the forward pass of the model on inputs of the given shapes.
+
+        Args:
+            inputs (dict): The model inputs, copied into static buffers used for replaying.
+        """
+        self._static_inputs = {key: value.clone() for key, value in inputs.items()}
+        with torch.cuda.device(self.device):
+            # Warm up on a side stream before capturing, as required by CUDA graphs
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream):
+                for _ in range(2):
+                    self.model(**self._static_inputs)
+            torch.cuda.current_stream().wait_stream(stream)
+
+            self._cuda_graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(self._cuda_graph):
+                self._static_outputs = self.model(**self._static_inputs)
+
+    def _forward(self, inputs: Dict[str, torch.Tensor]) -> Owlv2ObjectDetectionOutput:
+        """Runs the forward pass of the model.
+
+        If CUDA graphs are enabled, the forward pass is captured once for the shapes of
+        the inputs and replayed afterwards. The shapes only change for the last batch or
+        when the prompts change, in which case the graph is captured again.
+
+        Args:
+            inputs (dict): The model inputs.
+
+        Returns:
+            Owlv2ObjectDetectionOutput: The outputs of the model, held in static buffers
+            that are overwritten by the next replay when CUDA graphs are used.
+        """
+        if not self.use_cuda_graphs or torch.device(self.device).type != "cuda":
+            return self.model(**inputs)
+
+        if self._cuda_graph is None or any(
+            self._static_inputs[key].shape != value.shape
+            for key, value in inputs.items()
+        ):
+            try:
+                self._capture_cuda_graph(inputs)
+            except RuntimeError as e:
+                print(f"CUDA graph capture failed, running the model eagerly: {e}")
+                self.use_cuda_graphs = False
+                self._reset_cuda_graph()
+                return self.model(**inputs)
+
+        for key, value in inputs.items():
+            self._static_inputs[key].copy_(value)
+        self._cuda_graph.replay()
+        return self._static_outputs
+
     def _generate_annotations(
         self,
         images: List[PIL.Image.Image],
@@ -94,8 +185,13 @@ class OWLv2Annotator(BaseAnnotator):
             padding="max_length",
             truncation=True,
         ).to(self.device)
+        inputs["pixel_values"] = inputs["pixel_values"].to(self.dtype)
         with torch.no_grad():
-            outputs = self.model(**inputs)
+            outputs = self._forward(inputs)
+        # Post-process in full precision independently of the model dtype
+        outputs = Owlv2ObjectDetectionOutput(
+            logits=outputs.logits.float(), pred_boxes=outputs.pred_boxes.float()
+        )
         # print(outputs)
         preds = self.processor.post_process_object_detection(
             outputs=outputs, target_sizes=target_sizes, threshold=conf_threshold
@@ -264,6 +360,7 @@ class OWLv2Annotator(BaseAnnotator):
         Args:
             empty_cuda_cache (bool, optional): Whether to empty the CUDA cache. Defaults to False.
         """
+        self._reset_cuda_graph()
         self.model = self.model.to("cpu")
         if empty_cuda_cache:
             with torch.no_grad():
@@ -2,9 +2,10 @@ from __future__ import annotations
 
 import random
 from abc import abstractmethod
-from typing import List, Optional, Union
+from typing import List, Literal, Optional, Union
 
 import torch
+from diffusers.models.attention_processor import AttnProcessor2_0
 from PIL import Image
 from tqdm import tqdm
 
@@ -25,9 +26,13 @@ class ImageGenerator:
         seed (float): Seed for reproducibility.
         clip_image_tester (ClipImageTester): Instance of ClipImageTester if use_clip_image_tester is True.
         device (str): The device on which the model will run ('cuda' for GPU, 'cpu' for CPU).
+        use_torch_compile (bool): Flag to compile the UNet of the model with torch.compile.
+        attention_backend (str): The attention implementation to use, 'sdpa' or 'xformers'.
 
     Methods:
         set_seed(seed): Sets the seed for random number generators.
+        _place_pipeline(pipe): Places a diffusion pipeline on the GPU, with model CPU offloading unless compiled.
+        _set_attention_backend(pipe): Sets the attention implementation of a diffusion pipeline.
         generate_images(prompts, prompt_objects): Generates images based on provided prompts and optional object prompts.
         release(empty_cuda_cache): Releases resources and optionally empties the CUDA cache. (Abstract method)
         generate_image(prompt, negative_prompt, prompt_objects): Generates a single image based on the provided prompt. (Abstract method)
@@ -48,6 +53,8 @@ class ImageGenerator:
         batch_size: Optional[int] = 1,
         seed: Optional[float] = 42,
         device: str = "cuda",
+        use_torch_compile: Optional[bool] = False,
+        attention_backend: Optional[Literal["sdpa", "xformers"]] = "sdpa",
     ) -> None:
         """Initializes the ImageGenerator with the specified settings."""
         self.prompt_prefix = prompt_prefix
@@ -58,6 +65,8 @@ class ImageGenerator:
         self.image_tester_patience = image_tester_patience
         self.batch_size = batch_size
         self.device = device
+        self.use_torch_compile = use_torch_compile
+        self.attention_backend = attention_backend
         if self.use_clip_image_tester:
             self.clip_image_tester = ClipImageTester(self.device)
         if seed is not None:
@@ -74,6 +83,38 @@ class ImageGenerator:
         torch.manual_seed(seed)
         torch.cuda.manual_seed_all(seed)
 
+    def _place_pipeline(self, pipe) -> None:
+        """Places a diffusion pipeline on the GPU.
+
+        Model CPU offloading is used to reduce VRAM usage. When the UNet is compiled, the
+        whole pipeline is kept on the GPU instead, since offloading moves the weights on
+        every call and would invalidate the compiled CUDA graphs.
+
+        Args:
+            pipe: The diffusion pipeline to place.
+        """
+        if self.use_torch_compile:
+            pipe.to(self.device)
+        else:
+            pipe.enable_model_cpu_offload()
+
+    def _set_attention_backend(self, pipe) -> None:
+        """Sets the attention implementation used by a diffusion pipeline.
+
+        xFormers memory efficient attention is used if requested and available on a CUDA
+        device, otherwise the UNet falls back to PyTorch scaled dot product attention.
+
+        Args:
+            pipe: The diffusion pipeline to configure.
+        """
+        if self.attention_backend == "xformers" and self.device != "cpu":
+            try:
+                pipe.enable_xformers_memory_efficient_attention()
+                return
+            except (ModuleNotFoundError, ValueError) as e:
+                print(f"xFormers is not available, using SDPA attention instead: {e}")
+        pipe.unet.set_attn_processor(AttnProcessor2_0())
+
     def generate_images(
         self,
         prompts: Union[str, List[str]],
@@ -64,7 +64,7 @@ class StableDiffusionImageGenerator(ImageGenerator):
                 variant="fp16",
                 use_safetensors=True,
             )
-            base.enable_model_cpu_offload()
+            self._place_pipeline(base)
             refiner = DiffusionPipeline.from_pretrained(
                 "stabilityai/stable-diffusion-xl-refiner-1.0",
                 text_encoder_2=base.text_encoder_2,
@@ -73,7 +73,14 @@ class StableDiffusionImageGenerator(ImageGenerator):
                 use_safetensors=True,
                 variant="fp16",
             )
-            refiner.enable_model_cpu_offload()
+            self._place_pipeline(refiner)
+
+        self._set_attention_backend(base)
+        self._set_attention_backend(refiner)
+
+        if self.use_torch_compile:
+            base.unet = torch.compile(base.unet, mode="reduce-overhead")
+            refiner.unet = torch.compile(refiner.unet, mode="reduce-overhead")
 
         return base, refiner
 
@@ -97,6 +104,7 @@ class StableDiffusionImageGenerator(ImageGenerator):
         )
         return compel, compel_refiner
 
+    @torch.inference_mode()
     def generate_images_batch(
         self,
         prompts: List[str],
@@ -64,13 +64,18 @@ class StableDiffusionLightningImageGenerator(ImageGenerator):
             pipe = StableDiffusionXLPipeline.from_pretrained(
                 base, unet=unet, torch_dtype=torch.float16, variant="fp16"
             ).to(self.device)
-            pipe.enable_model_cpu_offload()
+            self._place_pipeline(pipe)
 
         # Ensure sampler uses "trailing" timesteps.
         pipe.scheduler = EulerDiscreteScheduler.from_config(
             pipe.scheduler.config, timestep_spacing="trailing"
         )
 
+        self._set_attention_backend(pipe)
+
+        if self.use_torch_compile:
+            pipe.unet = torch.compile(pipe.unet, mode="reduce-overhead")
+
         return pipe
 
     def _init_compel(self):
@@ -87,6 +92,7 @@ class StableDiffusionLightningImageGenerator(ImageGenerator):
         )
         return compel
 
+    @torch.inference_mode()
     def generate_images_batch(
         self,
         prompts: List[str],
@@ -51,10 +51,16 @@ class StableDiffusionTurboImageGenerator(ImageGenerator):
                 variant="fp16",
                 use_safetensors=True,
             )
-            base.enable_model_cpu_offload()
+            self._place_pipeline(base)
+
+        self._set_attention_backend(base)
+
+        if self.use_torch_compile:
+            base.unet = torch.compile(base.unet, mode="reduce-overhead")
 
         return base
 
+    @torch.inference_mode()
     def generate_images_batch(
         self,
         prompts: List[str],
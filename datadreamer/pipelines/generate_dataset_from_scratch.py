@@ -1,14 +1,17 @@
 from __future__ import annotations
 
 import argparse
+import gc
+import hashlib
+import io
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor, wait
 
-import matplotlib.patches as patches
-import matplotlib.pyplot as plt
 import numpy as np
+import orjson
 import torch
-from PIL import Image
+from PIL import Image, ImageDraw, ImageFont
 from tqdm import tqdm
 
 from datadreamer.dataset_annotation import OWLv2Annotator
@@ -25,6 +28,14 @@ from datadreamer.prompt_generation import (
     WordNetSynonymGenerator,
 )
 
+try:
+    from turbojpeg import TJPF_RGB, TurboJPEG
+
+    turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    # PyTurboJPEG or the libjpeg-turbo library is not available, fall back to Pillow
+    turbo_jpeg = None
+
 prompt_generators = {
     "simple": SimplePromptGenerator,
     "lm": LMPromptGenerator,
@@ -44,6 +55,15 @@ image_generators = {
 
 annotators = {"owlv2": OWLv2Annotator}
 
+# Options for serializing annotations, numpy arrays are written without conversion
+ORJSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+
+# Number of annotated batches between explicit garbage collections
+MEMORY_RELEASE_INTERVAL = 50
+
+# Font used for the labels of the bbox visualizations, loaded once
+bbox_font = ImageFont.load_default()
+
 
 def parse_args():
     # Argument parsing
@@ -120,6 +140,13 @@ def parse_args():
         help="Confidence threshold for object detection",
     )
 
+    parser.add_argument(
+        "--save_visualizations",
+        default=False,
+        action="store_true",
+        help="Whether to save images with the annotated bounding boxes drawn on them",
+    )
+
     parser.add_argument(
         "--use_tta",
         default=False,
@@ -146,7 +173,7 @@ def parse_args():
         type=str,
         default="none",
         choices=["none", "4bit"],
-        help="Quantization to use for Mistral language model",
+        help="Quantization to use for the language models",
     )
 
     parser.add_argument(
@@ -170,6 +197,13 @@ def parse_args():
         help="Batch size for image generation",
     )
 
+    parser.add_argument(
+        "--jpeg_quality",
+        type=int,
+        default=85,
+        help="JPEG quality of the saved generated images",
+    )
+
     parser.add_argument(
         "--device",
         type=str,
@@ -178,6 +212,42 @@ def parse_args():
         help="Device to use",
     )
 
+    parser.add_argument(
+        "--attention_backend",
+        type=str,
+        default="sdpa",
+        choices=["sdpa", "xformers"],
+        help="Attention implementation to use for image generation",
+    )
+
+    parser.add_argument(
+        "--annotator_device",
+        type=str,
+        default=None,
+        help="Device to run the annotator on, e.g. cuda:1 (defaults to --device)",
+    )
+
+    parser.add_argument(
+        "--annotator_fp16",
+        default=False,
+        action="store_true",
+        help="Whether to run the annotator in float16 on CUDA",
+    )
+
+    parser.add_argument(
+        "--use_torch_compile",
+        default=False,
+        action="store_true",
+        help="Whether to compile the image generation and annotation models with torch.compile",
+    )
+
+    parser.add_argument(
+        "--use_cuda_graphs",
+        default=False,
+        action="store_true",
+        help="Whether to capture and replay the annotation forward pass as a CUDA graph",
+    )
+
     parser.add_argument(
         "--seed", type=int, default=42, help="Random seed for image generation"
     )
@@ -187,11 +257,10 @@ def parse_args():
 
 def check_args(args):
     # Check save_dir
-    if not os.path.exists(args.save_dir):
-        try:
-            os.makedirs(args.save_dir)
-        except OSError as e:
-            raise ValueError(f"Cannot create directory {args.save_dir}: {e}") from e
+    try:
+        os.makedirs(args.save_dir, exist_ok=True)
+    except OSError as e:
+        raise ValueError(f"Cannot create directory {args.save_dir}: {e}") from e
 
     # Check class_names
     if not args.class_names or any(
@@ -232,14 +301,57 @@ def check_args(args):
         if not torch.cuda.is_available():
             raise ValueError("CUDA is not available. Please use --device cpu")
 
+    # Check attention_backend
+    if args.attention_backend == "xformers" and args.device == "cpu":
+        raise ValueError("--attention_backend xformers requires --device cuda")
+
+    # Check annotator_device
+    if args.annotator_device is not None:
+        try:
+            annotator_device = torch.device(args.annotator_device)
+        except RuntimeError as e:
+            raise ValueError(
+                f"Invalid --annotator_device {args.annotator_device}: {e}"
+            ) from e
+        if annotator_device.type not in ["cuda", "cpu"]:
+            raise ValueError("--annotator_device must be a CUDA device or cpu")
+        if annotator_device.type == "cuda" and (
+            not torch.cuda.is_available()
+            or (annotator_device.index or 0) >= torch.cuda.device_count()
+        ):
+            raise ValueError(
+                f"CUDA device {args.annotator_device} is not available for --annotator_device"
+            )
+
+    # Check use_torch_compile
+    if args.use_torch_compile and "cpu" in [
+        args.device,
+        torch.device(args.annotator_device or args.device).type,
+    ]:
+        raise ValueError(
+            "--use_torch_compile requires the image generator and the annotator to run on CUDA"
+        )
+
+    # Check use_cuda_graphs
+    if args.use_cuda_graphs:
+        if (args.annotator_device or args.device) == "cpu":
+            raise ValueError("--use_cuda_graphs requires the annotator to run on CUDA")
+        if args.use_torch_compile:
+            raise ValueError(
+                "--use_cuda_graphs cannot be combined with --use_torch_compile, which already uses CUDA graphs"
+            )
+
     # Check for LM quantization availability
     if args.lm_quantization != "none" and (
         args.device == "cpu"
         or not torch.cuda.is_available()
-        or args.prompt_generator != "lm"
+        or (
+            args.prompt_generator not in ["lm", "tiny"]
+            and args.synonym_generator != "llm"
+        )
     ):
         raise ValueError(
-            "LM Quantization is only available for CUDA devices and Mistral LM"
+            "LM Quantization is only available for CUDA devices and Mistral or TinyLlama LMs"
         )
 
     # Check batch_size_prompt
@@ -254,47 +366,114 @@ def check_args(args):
     if args.batch_size_image < 1:
         raise ValueError("--batch_size_image must be a positive integer")
 
+    # Check jpeg_quality
+    if not 1 <= args.jpeg_quality <= 100:
+        raise ValueError("--jpeg_quality must be between 1 and 100")
+
     # Check seed
     if args.seed < 0:
         raise ValueError("--seed must be a non-negative integer")
 
 
-def save_det_annotations_to_json(
-    image_paths,
-    boxes_list,
-    labels_list,
-    class_names,
-    save_dir,
-    file_name="annotations.json",
+def save_det_annotations_to_jsonl(f, image_names, digests, boxes_list, labels_list):
+    # Write one JSON line per image, orjson serializes C-contiguous numpy arrays natively.
+    # The digest of the image file identifies the image the annotations belong to
+    for image_name, digest, bboxes, labels in zip(
+        image_names, digests, boxes_list, labels_list
+    ):
+        record = {
+            "name": image_name,
+            "digest": digest,
+            "boxes": np.ascontiguousarray(bboxes),
+            "labels": np.ascontiguousarray(labels),
+        }
+        f.write(orjson.dumps(record, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n")
+    f.flush()
+
+
+def load_annotated_image_digests(jsonl_path):
+    # Read the names and file digests of the images already recorded in a JSON lines
+    # checkpoint. A last line cut off by an interrupted write is truncated so that
+    # appending stays valid
+    if not os.path.isfile(jsonl_path):
+        return {}
+    with open(jsonl_path, "rb+") as f:
+        data = f.read()
+        complete_size = data.rfind(b"\n") + 1
+        if complete_size < len(data):
+            f.truncate(complete_size)
+    annotated_image_digests = {}
+    for line in data[:complete_size].splitlines():
+        record = orjson.loads(line)
+        annotated_image_digests[record["name"]] = record.get("digest")
+    return annotated_image_digests
+
+
+def convert_det_annotations_jsonl_to_json(
+    jsonl_path, class_names, save_dir, file_name="annotations.json"
 ):
     annotations = {}
-    for image_path, bboxes, labels in zip(image_paths, boxes_list, labels_list):
-        image_name = os.path.basename(image_path)
-        annotations[image_name] = {
-            "boxes": bboxes.tolist(),
-            "labels": labels.tolist(),
-        }
+    with open(jsonl_path, "rb") as f:
+        for line in f:
+            record = orjson.loads(line)
+            annotations[record["name"]] = {
+                "boxes": record["boxes"],
+                "labels": record["labels"],
+            }
     annotations["class_names"] = class_names
 
     # Save to JSON file
-    with open(os.path.join(save_dir, file_name), "w") as f:
-        json.dump(annotations, f, indent=4)
+    with open(os.path.join(save_dir, file_name), "wb") as f:
+        f.write(orjson.dumps(annotations, option=ORJSON_OPTIONS))
 
 
 def save_clf_annotations_to_json(
-    image_paths, labels_list, class_names, save_dir, file_name="annotations.json"
+    image_names, labels_list, class_names, save_dir, file_name="annotations.json"
 ):
     annotations = {}
-    for image_path, labels in zip(image_paths, labels_list):
-        image_name = os.path.basename(image_path)
+    for image_name, labels in zip(image_names, labels_list):
         annotations[image_name] = {
-            "labels": labels.tolist(),
+            "labels": np.ascontiguousarray(labels),
         }
     annotations["class_names"] = class_names
 
     # Save to JSON file
-    with open(os.path.join(save_dir, file_name), "w") as f:
-        json.dump(annotations, f, indent=4)
+    with open(os.path.join(save_dir, file_name), "wb") as f:
+        f.write(orjson.dumps(annotations, option=ORJSON_OPTIONS))
+
+
+def _normalize_device(device):
+    # Resolve "cuda" to the current CUDA device so that it compares equal to "cuda:0"
+    device = torch.device(device)
+    if device.type == "cuda" and device.index is None:
+        device = torch.device("cuda", torch.cuda.current_device())
+    return device
+
+
+def _file_digest(data):
+    # Digest of the content of an image file, recorded with its annotations
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _open_image(image_path):
+    """Reads an image file in a single pass and decodes it eagerly to RGB.
+
+    PIL decodes lazily on first access, so the pixel data is loaded here to keep the
+    decoding on the worker thread that opens the image. JPEG images are decoded with
+    libjpeg-turbo when PyTurboJPEG is installed.
+
+    Returns:
+        tuple: The decoded image and the digest of the file content.
+    """
+    with open(image_path, "rb") as f:
+        data = f.read()
+    digest = _file_digest(data)
+    if turbo_jpeg is not None and image_path.lower().endswith((".jpg", ".jpeg")):
+        return Image.fromarray(turbo_jpeg.decode(data, pixel_format=TJPF_RGB)), digest
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    # Convert only if needed, convert() copies the image even if the mode matches
+    return (image if image.mode == "RGB" else image.convert("RGB")), digest
 
 
 def main():
@@ -303,15 +482,28 @@ def main():
 
     save_dir = args.save_dir
 
-    # Directories for saving images and bboxes
+    # Directory for saving bboxes, save_dir has already been created by check_args
     bbox_dir = os.path.join(save_dir, "bboxes_visualization")
-    if not os.path.exists(save_dir):
-        os.makedirs(save_dir)
-    if not os.path.exists(bbox_dir):
-        os.makedirs(bbox_dir)
+    if args.save_visualizations:
+        os.makedirs(bbox_dir, exist_ok=True)
+
+    # Annotations checkpointed by a previous run are only resumed if it was started
+    # with the same arguments, otherwise labels and thresholds could differ
+    args_path = os.path.join(save_dir, "generation_args.json")
+    annotations_jsonl_path = os.path.join(save_dir, "annotations.jsonl")
+    resume = False
+    if os.path.isfile(args_path):
+        try:
+            with open(args_path) as f:
+                resume = json.load(f) == vars(args)
+        except (OSError, ValueError):
+            # Unreadable or corrupt arguments of a previous run, start from scratch
+            resume = False
+    if not resume and os.path.isfile(annotations_jsonl_path):
+        os.remove(annotations_jsonl_path)
 
     # Save arguments
-    with open(os.path.join(save_dir, "generation_args.json"), "w") as f:
+    with open(args_path, "w") as f:
         json.dump(vars(args), f, indent=4)
 
     # Prompt generation
@@ -335,13 +527,32 @@ def main():
     synonym_dict = None
     if args.synonym_generator != "none":
         synonym_generator_class = synonym_generators[args.synonym_generator]
-        synonym_generator = synonym_generator_class(device=args.device)
+        synonym_generator = synonym_generator_class(
+            device=args.device, quantization=args.lm_quantization
+        )
         synonym_dict = synonym_generator.generate_synonyms_for_list(args.class_names)
         synonym_generator.release(empty_cuda_cache=True)
         synonym_generator.save_synonyms(
             synonym_dict, os.path.join(save_dir, "synonyms.json")
         )
 
+    # Models are built on the main thread only, since loading them changes process-wide
+    # state (default dtype, patched parameter registration). An annotator on a separate
+    # device is built before image generation and stays resident. Otherwise it is built
+    # once the image generator has been released so that peak VRAM on a single GPU is
+    # unchanged.
+    annotator = None
+    annotator_device = args.annotator_device or args.device
+    if args.task == "detection":
+        annotator_class = annotators[args.image_annotator]
+        if _normalize_device(annotator_device) != _normalize_device(args.device):
+            annotator = annotator_class(
+                device=annotator_device,
+                use_torch_compile=args.use_torch_compile,
+                use_cuda_graphs=args.use_cuda_graphs,
+                use_fp16=args.annotator_fp16,
+            )
+
     # Image generation
     image_generator_class = image_generators[args.image_generator]
     image_generator = image_generator_class(
@@ -350,110 +561,211 @@ def main():
         image_tester_patience=args.image_tester_patience,
         batch_size=args.batch_size_image,
         device=args.device,
+        use_torch_compile=args.use_torch_compile,
+        attention_backend=args.attention_backend,
     )
 
-    prompts = [p[1] for p in generated_prompts]
-    prompt_objects = [p[0] for p in generated_prompts]
+    if generated_prompts:
+        prompt_objects, prompts = map(list, zip(*generated_prompts))
+    else:
+        prompt_objects, prompts = [], []
 
     image_paths = []
+    image_names = []
     num_generated_images = 0
+    # Save images in the background so the next batch can be generated right away
+    save_pool = ThreadPoolExecutor(max_workers=4)
+    save_futures = []
     for generated_images_batch in image_generator.generate_images(
         prompts, prompt_objects
     ):
         for generated_image in generated_images_batch:
-            image_path = os.path.join(save_dir, f"image_{num_generated_images}.jpg")
-            generated_image.save(image_path)
+            image_name = f"image_{num_generated_images}.jpg"
+            image_path = os.path.join(save_dir, image_name)
+            save_futures.append(
+                save_pool.submit(
+                    generated_image.save,
+                    image_path,
+                    "JPEG",
+                    quality=args.jpeg_quality,
+                    optimize=False,
+                    progressive=False,
+                )
+            )
             image_paths.append(image_path)
+            image_names.append(image_name)
             num_generated_images += 1
 
+    wait(save_futures)
+    save_pool.shutdown()
+    # Re-raise any error that occurred while saving
+    for future in save_futures:
+        future.result()
+
+    if args.task == "detection":
+        # Skip the images annotated by an interrupted previous run and split the
+        # remaining ones into batches. Images are generated again on a rerun, so the
+        # annotations of an image are only reused if its file content is unchanged
+        annotated_image_digests = load_annotated_image_digests(annotations_jsonl_path)
+        pending_indices = []
+        for idx, image_name in enumerate(image_names):
+            recorded_digest = annotated_image_digests.get(image_name)
+            if recorded_digest is not None:
+                with open(image_paths[idx], "rb") as f:
+                    if _file_digest(f.read()) == recorded_digest:
+                        continue
+            pending_indices.append(idx)
+        index_batches = [
+            pending_indices[i : i + args.batch_size_annotation]
+            for i in range(0, len(pending_indices), args.batch_size_annotation)
+        ]
+
+        # Decode images on a thread pool. The first batch is decoded while the image
+        # generator is released and the annotator is built, and each next batch while
+        # the current one is being annotated
+        decode_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+        next_images_futures = [
+            decode_pool.submit(_open_image, image_paths[idx])
+            for idx in (index_batches[0] if index_batches else [])
+        ]
+
     image_generator.release(empty_cuda_cache=True)
 
     if args.task == "classification":
         # Classification annotation
-        labels_list = []
-        for prompt_objs in prompt_objects:
-            labels = []
-            for obj in prompt_objs:
-                labels.append(args.class_names.index(obj))
-            labels_list.append(np.unique(labels))
+        name_to_idx = {name: idx for idx, name in enumerate(args.class_names)}
+        labels_list = [
+            np.unique(
+                np.fromiter(
+                    (name_to_idx[obj] for obj in prompt_objs),
+                    dtype=np.int32,
+                    count=len(prompt_objs),
+                )
+            )
+            for prompt_objs in prompt_objects
+        ]
 
         save_clf_annotations_to_json(
-            image_paths, labels_list, args.class_names, save_dir
+            image_names, labels_list, args.class_names, save_dir
         )
     else:
         # Annotation
-        annotator_class = annotators[args.image_annotator]
-        annotator = annotator_class(device=args.device)
-
-        boxes_list = []
-        scores_list = []
-        labels_list = []
-
-        # Split image_paths into batches
-        image_batches = [
-            image_paths[i : i + args.batch_size_annotation]
-            for i in range(0, len(image_paths), args.batch_size_annotation)
-        ]
-
-        for i, image_batch in tqdm(
-            enumerate(image_batches),
-            desc="Annotating images",
-            total=len(image_batches),
-        ):
-            images = [Image.open(image_path) for image_path in image_batch]
-            boxes_batch, scores_batch, local_labels_batch = annotator.annotate_batch(
-                images,
-                args.class_names,
-                conf_threshold=args.conf_threshold,
-                use_tta=args.use_tta,
-                synonym_dict=synonym_dict,
+        if annotator is None:
+            annotator = annotator_class(
+                device=annotator_device,
+                use_torch_compile=args.use_torch_compile,
+                use_cuda_graphs=args.use_cuda_graphs,
+                use_fp16=args.annotator_fp16,
             )
 
-            boxes_list.extend(boxes_batch)
-            scores_list.extend(scores_batch)
-
-            for j, image in enumerate(images):
-                labels = []
-                # Save bbox visualizations
-                fig, ax = plt.subplots(1)
-                ax.imshow(image)
-                for box, score, label in zip(
-                    boxes_batch[j], scores_batch[j], local_labels_batch[j]
-                ):
-                    labels.append(label)
-                    x1, y1, x2, y2 = box
-                    rect = patches.Rectangle(
-                        (x1, y1),
-                        x2 - x1,
-                        y2 - y1,
-                        linewidth=2,
-                        edgecolor="r",
-                        facecolor="none",
+        # Stream the annotations of every batch to a JSON lines file, so that they
+        # are not kept in memory and a rerun with the same arguments resumes from them.
+        # Records of an image annotated again are superseded by the later line
+        with open(annotations_jsonl_path, "ab") as annotations_jsonl:
+            # Warm up the compiled model on the first batch, which has the batch size
+            # of the loop, so that compilation is not part of the loop. The images are
+            # only read by the warmup and are annotated again in the first iteration
+            if args.use_torch_compile and index_batches:
+                annotator.annotate_batch(
+                    [future.result()[0] for future in next_images_futures],
+                    args.class_names,
+                    conf_threshold=args.conf_threshold,
+                    use_tta=args.use_tta,
+                    synonym_dict=synonym_dict,
+                )
+
+            for i in tqdm(
+                range(len(index_batches)),
+                desc="Annotating images",
+                total=len(index_batches),
+                mininterval=1.0,
+                smoothing=0,
+            ):
+                loaded_images = [future.result() for future in next_images_futures]
+                images = [image for image, _ in loaded_images]
+                digests = [digest for _, digest in loaded_images]
+                next_images_futures = [
+                    decode_pool.submit(_open_image, image_paths[idx])
+                    for idx in (
+                        index_batches[i + 1] if i + 1 < len(index_batches) else []
                     )
-                    ax.add_patch(rect)
-                    label_text = args.class_names[label]
-                    plt.text(
-                        x1,
-                        y1,
-                        f"{label_text} {score:.2f}",
-                        bbox=dict(facecolor="yellow", alpha=0.5),
+                ]
+                try:
+                    (
+                        boxes_batch,
+                        scores_batch,
+                        local_labels_batch,
+                    ) = annotator.annotate_batch(
+                        images,
+                        args.class_names,
+                        conf_threshold=args.conf_threshold,
+                        use_tta=args.use_tta,
+                        synonym_dict=synonym_dict,
                     )
-                    # Add prompt text as title
-                    plt.title(generated_prompts[i * args.batch_size_annotation + j][1])
-
-                labels_list.append(np.array(labels))
 
-                plt.savefig(
-                    os.path.join(
-                        bbox_dir, f"bbox_{i * args.batch_size_annotation + j}.jpg"
+                    labels_batch = []
+                    for j, image in enumerate(images):
+                        labels_batch.append(
+                            np.asarray(local_labels_batch[j], dtype=np.int32)
+                        )
+                        if not args.save_visualizations:
+                            continue
+
+                        # Save bbox visualizations
+                        draw = ImageDraw.Draw(image)
+                        for box, score, label in zip(
+                            boxes_batch[j], scores_batch[j], local_labels_batch[j]
+                        ):
+                            x1, y1, x2, y2 = box
+                            draw.rectangle([x1, y1, x2, y2], outline="red", width=2)
+                            label_text = args.class_names[label]
+                            draw.text(
+                                (x1, y1 - 12),
+                                f"{label_text} {score:.2f}",
+                                fill="yellow",
+                                font=bbox_font,
+                            )
+
+                        idx = index_batches[i][j]
+                        image.save(
+                            os.path.join(bbox_dir, f"bbox_{idx}.jpg"), quality=90
+                        )
+
+                    save_det_annotations_to_jsonl(
+                        annotations_jsonl,
+                        [image_names[idx] for idx in index_batches[i]],
+                        digests,
+                        boxes_batch,
+                        labels_batch,
                     )
+                finally:
+                    # Free the decoded pixel buffers and file handles of the batch
+                    for image in images:
+                        image.close()
+
+                del (
+                    loaded_images,
+                    images,
+                    digests,
+                    boxes_batch,
+                    scores_batch,
+                    local_labels_batch,
+                    labels_batch,
                 )
-                plt.close()
 
-        # Save annotations as JSON files
-        save_det_annotations_to_json(
-            image_paths, boxes_list, labels_list, args.class_names, save_dir
+                # Periodically release memory so that peak usage stays bounded
+                if (i + 1) % MEMORY_RELEASE_INTERVAL == 0:
+                    gc.collect()
+                    if torch.device(annotator.device).type == "cuda":
+                        torch.cuda.empty_cache()
+
+            decode_pool.shutdown()
+
+        # Assemble the streamed annotations into the final JSON file
+        convert_det_annotations_jsonl_to_json(
+            annotations_jsonl_path, args.class_names, save_dir
         )
+        os.remove(annotations_jsonl_path)
 
 
 if __name__ == "__main__":
@@ -89,13 +89,14 @@ class LMPromptGenerator(PromptGenerator):
                 )
             else:
                 print("Loading INT4 language model on GPU...")
+                selected_dtype = torch.bfloat16
                 # Create the BitsAndBytesConfig object with the dynamically constructed arguments
                 bnb_config = BitsAndBytesConfig(
                     load_in_4bit=True,
                     bnb_4bit_use_double_quant=True,
                     bnb_4bit_quant_type="nf4",
+                    bnb_4bit_compute_dtype=selected_dtype,
                 )
-                selected_dtype = torch.bfloat16
 
                 model = AutoModelForCausalLM.from_pretrained(
                     "mistralai/Mistral-7B-Instruct-v0.1",
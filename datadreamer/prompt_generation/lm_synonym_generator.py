@@ -1,12 +1,13 @@
 from __future__ import annotations
 
 import re
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 import torch
 from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
+    BitsAndBytesConfig,
     Pipeline,
     pipeline,
 )
@@ -22,6 +23,7 @@ class LMSynonymGenerator(SynonymGenerator):
         synonyms_number (int): Number of synonyms to generate for each word.
         seed (Optional[float]): Seed for randomization.
         device (str): Device for model inference (default is "cuda").
+        quantization (str): Quantization type for the language model (default is "none").
 
     Methods:
         _init_lang_model(): Initializes the language model and tokenizer.
@@ -37,9 +39,10 @@ class LMSynonymGenerator(SynonymGenerator):
         synonyms_number: int = 5,
         seed: Optional[float] = 42,
         device: str = "cuda",
+        quantization: Optional[Literal["none", "4bit"]] = "none",
     ) -> None:
         """Initializes the SynonymGenerator with parameters."""
-        super().__init__(synonyms_number, seed, device)
+        super().__init__(synonyms_number, seed, device, quantization)
         self.model, self.tokenizer, self.pipeline = self._init_lang_model()
 
     def _init_lang_model(self) -> tuple[AutoModelForCausalLM, AutoTokenizer, Pipeline]:
@@ -48,6 +51,7 @@ class LMSynonymGenerator(SynonymGenerator):
         Returns:
             tuple: The initialized language model, tokenizer and pipeline.
         """
+        selected_dtype = "auto"
         if self.device == "cpu":
             print("Loading language model on CPU...")
             model = AutoModelForCausalLM.from_pretrained(
@@ -57,20 +61,39 @@ class LMSynonymGenerator(SynonymGenerator):
                 low_cpu_mem_usage=True,
             )
         else:
-            print("Loading FP16 language model on GPU...")
-            model = AutoModelForCausalLM.from_pretrained(
-                "mistralai/Mistral-7B-Instruct-v0.1",
-                torch_dtype=torch.float16,
-                trust_remote_code=True,
-                device_map=self.device,
-            )
+            if self.quantization == "none":
+                print("Loading FP16 language model on GPU...")
+                selected_dtype = torch.float16
+                model = AutoModelForCausalLM.from_pretrained(
+                    "mistralai/Mistral-7B-Instruct-v0.1",
+                    torch_dtype=selected_dtype,
+                    trust_remote_code=True,
+                    device_map=self.device,
+                )
+            else:
+                print("Loading INT4 language model on GPU...")
+                selected_dtype = torch.bfloat16
+                bnb_config = BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_use_double_quant=True,
+                    bnb_4bit_quant_type="nf4",
+                    bnb_4bit_compute_dtype=selected_dtype,
+                )
+
+                model = AutoModelForCausalLM.from_pretrained(
+                    "mistralai/Mistral-7B-Instruct-v0.1",
+                    quantization_config=bnb_config,
+                    torch_dtype=selected_dtype,
+                    device_map=self.device,
+                    trust_remote_code=True,
+                )
 
         tokenizer = AutoTokenizer.from_pretrained("mistralai/Mistral-7B-Instruct-v0.1")
         pipe = pipeline(
             "text-generation",
             model=model,
             tokenizer=tokenizer,
-            torch_dtype=torch.float16 if self.device == "cuda" else "auto",
+            torch_dtype=selected_dtype,
             device_map=self.device,
         )
         print("Done!")
@@ -151,7 +174,8 @@ class LMSynonymGenerator(SynonymGenerator):
         Args:
             empty_cuda_cache (bool): Whether to empty the CUDA cache (default is False).
         """
-        self.model = self.model.to("cpu")
+        if self.quantization == "none":
+            self.model = self.model.to("cpu")
         if empty_cuda_cache:
             with torch.no_grad():
                 torch.cuda.empty_cache()
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import json
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from tqdm import tqdm
 
@@ -15,6 +15,7 @@ class SynonymGenerator(ABC):
         synonyms_number (int): Number of synonyms to generate for each word.
         seed (Optional[float]): Seed for randomization.
         device (str): Device to run the prompt generator on ('cuda' for GPU, 'cpu' for CPU).
+        quantization (str): Quantization type for the synonym generator.
 
     Methods:
         _init_lang_model(): Initializes the language model and tokenizer.
@@ -32,11 +33,13 @@ class SynonymGenerator(ABC):
         synonyms_number: int = 5,
         seed: Optional[float] = 42,
         device: str = "cuda",
+        quantization: Optional[Literal["none", "4bit"]] = "none",
     ) -> None:
         """Initializes the SynonymGenerator with parameters."""
         self.synonyms_number = synonyms_number
         self.seed = seed
         self.device = device
+        self.quantization = quantization if quantization is not None else "none"
 
     def generate_synonyms_for_list(self, words: List[str]) -> dict:
         """Generates synonyms for a list of words and returns them in a dictionary.
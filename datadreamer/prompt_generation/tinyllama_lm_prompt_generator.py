@@ -4,7 +4,13 @@ import re
 from typing import List, Literal, Optional
 
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, Pipeline, pipeline
+from transformers import (
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    BitsAndBytesConfig,
+    Pipeline,
+    pipeline,
+)
 
 from datadreamer.prompt_generation.lm_prompt_generator import LMPromptGenerator
 
@@ -53,6 +59,7 @@ class TinyLlamaLMPromptGenerator(LMPromptGenerator):
         Returns:
             tuple: The initialized language model, tokenizer and pipeline.
         """
+        selected_dtype = "auto"
         if self.device == "cpu":
             print("Loading language model on CPU...")
             model = AutoModelForCausalLM.from_pretrained(
@@ -62,12 +69,30 @@ class TinyLlamaLMPromptGenerator(LMPromptGenerator):
                 low_cpu_mem_usage=True,
             )
         else:
-            print("Loading language model on GPU...")
-            model = AutoModelForCausalLM.from_pretrained(
-                "TinyLlama/TinyLlama-1.1B-Chat-v1.0",
-                torch_dtype=torch.float16,
-                device_map=self.device,
-            )
+            if self.quantization == "none":
+                print("Loading language model on GPU...")
+                selected_dtype = torch.float16
+                model = AutoModelForCausalLM.from_pretrained(
+                    "TinyLlama/TinyLlama-1.1B-Chat-v1.0",
+                    torch_dtype=selected_dtype,
+                    device_map=self.device,
+                )
+            else:
+                print("Loading INT4 language model on GPU...")
+                selected_dtype = torch.bfloat16
+                bnb_config = BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_use_double_quant=True,
+                    bnb_4bit_quant_type="nf4",
+                    bnb_4bit_compute_dtype=selected_dtype,
+                )
+
+                model = AutoModelForCausalLM.from_pretrained(
+                    "TinyLlama/TinyLlama-1.1B-Chat-v1.0",
+                    quantization_config=bnb_config,
+                    torch_dtype=selected_dtype,
+                    device_map=self.device,
+                )
 
         tokenizer = AutoTokenizer.from_pretrained(
             "TinyLlama/TinyLlama-1.1B-Chat-v1.0",
@@ -78,7 +103,7 @@ class TinyLlamaLMPromptGenerator(LMPromptGenerator):
             "text-generation",
             model=model,
             tokenizer=tokenizer,
-            torch_dtype=torch.float16 if self.device == "cuda" else "auto",
+            torch_dtype=selected_dtype,
             device_map=self.device,
             batch_size=self.batch_size,
         )
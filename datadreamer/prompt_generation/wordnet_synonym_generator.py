@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 import nltk
 from nltk.corpus import wordnet
@@ -28,9 +28,10 @@ class WordNetSynonymGenerator(SynonymGenerator):
         synonyms_number: int = 5,
         seed: Optional[float] = 42,
         device: str = "cuda",
+        quantization: Optional[Literal["none", "4bit"]] = "none",
     ) -> None:
         """Initializes the SynonymGenerator with parameters."""
-        super().__init__(synonyms_number, seed, device)
+        super().__init__(synonyms_number, seed, device, quantization)
 
     def generate_synonyms(self, word: str) -> List[str]:
         """Generates synonyms for a single word and returns them in a list.
@@ -28,10 +28,11 @@ def _check_detection_pipeline(cmd: str, target_folder: str):
     # Check that all the files were created
     for file in files:
         assert os.path.isfile(os.path.join(target_folder, file)), f"{file} not created"
-    # Check that the "bboxes_visualization" folder was created
-    assert os.path.isdir(
-        os.path.join(target_folder, "bboxes_visualization")
-    ), "bboxes_visualization directory not created"
+    # Check that the "bboxes_visualization" folder was created if requested
+    if "--save_visualizations" in cmd:
+        assert os.path.isdir(
+            os.path.join(target_folder, "bboxes_visualization")
+        ), "bboxes_visualization directory not created"
 
 
 def _check_wrong_argument_choice(cmd: str):
@@ -170,6 +171,36 @@ def test_invalid_device_lm_quantization():
     _check_wrong_value(cmd)
 
 
+def test_invalid_device_attention_backend():
+    # Define the cmd
+    cmd = "datadreamer --device cpu --attention_backend xformers"
+    _check_wrong_value(cmd)
+
+
+def test_invalid_annotator_device():
+    # Define the cmd
+    cmd = "datadreamer --device cpu --annotator_device invalid"
+    _check_wrong_value(cmd)
+
+
+def test_invalid_device_torch_compile():
+    # Define the cmd
+    cmd = "datadreamer --device cpu --use_torch_compile"
+    _check_wrong_value(cmd)
+
+
+def test_invalid_device_cuda_graphs():
+    # Define the cmd
+    cmd = "datadreamer --device cpu --use_cuda_graphs"
+    _check_wrong_value(cmd)
+
+
+def test_invalid_jpeg_quality():
+    # Define the cmd
+    cmd = "datadreamer --jpeg_quality 0"
+    _check_wrong_value(cmd)
+
+
 def test_invalid_batch_size_prompt():
     # Define the cmd
     cmd = "datadreamer --batch_size_prompt -1"
@@ -231,6 +262,7 @@ def test_cpu_simple_sdxl_turbo_detection_pipeline():
         f"--num_objects_range 1 2 "
         f"--image_generator sdxl-turbo "
         f"--use_image_tester "
+        f"--save_visualizations "
         f"--device cpu"
     )
     # Check the run of the pipeline
@@ -253,6 +285,7 @@ def test_cuda_simple_sdxl_turbo_detection_pipeline():
         f"--num_objects_range 1 2 "
         f"--image_generator sdxl-turbo "
         f"--use_image_tester "
+        f"--save_visualizations "
         f"--device cuda"
     )
     # Check the run of the pipeline
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import json
+import os
+
+import numpy as np
+
+from datadreamer.pipelines.generate_dataset_from_scratch import (
+    convert_det_annotations_jsonl_to_json,
+    load_annotated_image_digests,
+    save_det_annotations_to_jsonl,
+)
+
+
+def _save_det_annotations(jsonl_path: str):
+    with open(jsonl_path, "ab") as f:
+        save_det_annotations_to_jsonl(
+            f,
+            ["image_0.jpg", "image_1.jpg"],
+            ["digest_0", "digest_1"],
+            [
+                np.array([[0.1, 2.5, 30.0, 40.25]], dtype=np.float32),
+                np.zeros((0, 4), dtype=np.float32),
+            ],
+            [np.array([1], dtype=np.int32), np.zeros((0,), dtype=np.int32)],
+        )
+
+
+def test_det_annotations_jsonl_round_trip(tmp_path):
+    jsonl_path = os.path.join(tmp_path, "annotations.jsonl")
+    _save_det_annotations(jsonl_path)
+    convert_det_annotations_jsonl_to_json(jsonl_path, ["bus", "people"], tmp_path)
+
+    with open(os.path.join(tmp_path, "annotations.json")) as f:
+        text = f.read()
+    # Check that the file is indented with two spaces
+    assert text.startswith('{\n  "image_0.jpg"')
+    annotations = json.loads(text)
+    # Check that float32 values keep their shortest representation
+    assert annotations["image_0.jpg"] == {
+        "boxes": [[0.1, 2.5, 30.0, 40.25]],
+        "labels": [1],
+    }
+    # Check that an image without detections is kept
+    assert annotations["image_1.jpg"] == {"boxes": [], "labels": []}
+    assert annotations["class_names"] == ["bus", "people"]
+
+
+def test_load_annotated_image_digests(tmp_path):
+    jsonl_path = os.path.join(tmp_path, "annotations.jsonl")
+    assert load_annotated_image_digests(jsonl_path) == {}
+
+    _save_det_annotations(jsonl_path)
+    # Simulate a write interrupted in the middle of a line
+    with open(jsonl_path, "ab") as f:
+        f.write(b'{"name":"image_2.jpg","bo')
+    assert load_annotated_image_digests(jsonl_path) == {
+        "image_0.jpg": "digest_0",
+        "image_1.jpg": "digest_1",
+    }
+
+    # Check that the cut off line was removed so that records can be appended again
+    _save_det_annotations(jsonl_path)
+    with open(jsonl_path, "rb") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 4
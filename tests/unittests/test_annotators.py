@@ -46,6 +46,78 @@ def test_cuda_owlv2_annotator():
     _check_owlv2_annotator("cuda")
 
 
+@pytest.mark.skipif(
+    not torch.cuda.is_available() or total_disk_space < 15,
+    reason="Test requires GPU and 15GB of HDD",
+)
+def test_cuda_graphs_owlv2_annotator():
+    url = "https://ultralytics.com/images/bus.jpg"
+    im = Image.open(requests.get(url, stream=True).raw)
+    eager_annotator = OWLv2Annotator(device="cuda", use_fp16=True)
+    eager_boxes, eager_scores, eager_labels = eager_annotator.annotate_batch(
+        [im], ["bus", "people"]
+    )
+    eager_annotator.release(empty_cuda_cache=True)
+
+    annotator = OWLv2Annotator(device="cuda", use_cuda_graphs=True, use_fp16=True)
+    # The first batch captures the graph, the second one replays it
+    cuda_graph = None
+    for _ in range(2):
+        final_boxes, final_scores, final_labels = annotator.annotate_batch(
+            [im], ["bus", "people"]
+        )
+        # Check that the graph was captured and not replaced by the eager fallback
+        assert annotator.use_cuda_graphs and annotator._cuda_graph is not None
+        assert cuda_graph is None or annotator._cuda_graph is cuda_graph
+        cuda_graph = annotator._cuda_graph
+        # Check that the results match the eager model within fp16 tolerance
+        assert final_boxes[0].shape == eager_boxes[0].shape
+        np.testing.assert_allclose(final_boxes[0], eager_boxes[0], atol=1.0)
+        np.testing.assert_allclose(final_scores[0], eager_scores[0], atol=1e-2)
+        np.testing.assert_array_equal(final_labels[0], eager_labels[0])
+
+
+@pytest.mark.skipif(
+    not torch.cuda.is_available() or total_disk_space < 15,
+    reason="Test requires GPU and 15GB of HDD",
+)
+def test_cuda_fp16_owlv2_annotator():
+    url = "https://ultralytics.com/images/bus.jpg"
+    im = Image.open(requests.get(url, stream=True).raw)
+    fp32_annotator = OWLv2Annotator(device="cuda")
+    assert fp32_annotator.dtype == torch.float32
+    fp32_boxes, fp32_scores, fp32_labels = fp32_annotator.annotate_batch(
+        [im], ["bus", "people"]
+    )
+    fp32_annotator.release(empty_cuda_cache=True)
+
+    annotator = OWLv2Annotator(device="cuda", use_fp16=True)
+    assert annotator.dtype == torch.float16
+    final_boxes, final_scores, final_labels = annotator.annotate_batch(
+        [im], ["bus", "people"]
+    )
+
+    # Compare the confident detections, ordered by label and position, since
+    # detections close to the confidence threshold may differ between precisions
+    def _confident_detections(boxes, scores, labels):
+        keep = scores > 0.3
+        boxes, scores, labels = boxes[keep], scores[keep], labels[keep]
+        order = np.lexsort((boxes[:, 0], labels))
+        return boxes[order], scores[order], labels[order]
+
+    fp32_boxes, fp32_scores, fp32_labels = _confident_detections(
+        fp32_boxes[0], fp32_scores[0], fp32_labels[0]
+    )
+    final_boxes, final_scores, final_labels = _confident_detections(
+        final_boxes[0], final_scores[0], final_labels[0]
+    )
+    # Check that fp16 matches the fp32 model within fp16 tolerance
+    assert final_boxes.shape == fp32_boxes.shape and final_boxes.shape[0] > 0
+    np.testing.assert_array_equal(final_labels, fp32_labels)
+    np.testing.assert_allclose(final_boxes, fp32_boxes, atol=2.0)
+    np.testing.assert_allclose(final_scores, fp32_scores, atol=2e-2)
+
+
 @pytest.mark.skipif(
     total_disk_space < 15,
     reason="Test requires at least 15GB of HDD",
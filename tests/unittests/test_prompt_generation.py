@@ -100,6 +100,14 @@ def test_cuda_tinyllama_lm_prompt_generator():
     _check_lm_prompt_generator("cuda", TinyLlamaLMPromptGenerator)
 
 
+@pytest.mark.skipif(
+    total_memory < 8 or not torch.cuda.is_available() or total_disk_space < 12,
+    reason="Test requires at least 8GB of RAM, 12GB of HDD and CUDA support",
+)
+def test_cuda_4bit_tinyllama_lm_prompt_generator():
+    _check_lm_prompt_generator("cuda", TinyLlamaLMPromptGenerator, quantization="4bit")
+
+
 @pytest.mark.skipif(
     total_memory < 12 or total_disk_space < 12,
     reason="Test requires at least 12GB of RAM and 12GB of HDD for running on CPU",
@@ -108,9 +116,13 @@ def test_cpu_tinyllama_lm_prompt_generator():
     _check_lm_prompt_generator("cpu", TinyLlamaLMPromptGenerator)
 
 
-def _check_synonym_generator(device: str, synonym_generator_class=LMSynonymGenerator):
+def _check_synonym_generator(
+    device: str, synonym_generator_class=LMSynonymGenerator, quantization: str = "none"
+):
     synonyms_num = 3
-    generator = synonym_generator_class(synonyms_number=synonyms_num, device=device)
+    generator = synonym_generator_class(
+        synonyms_number=synonyms_num, device=device, quantization=quantization
+    )
     synonyms = generator.generate_synonyms_for_list(["astronaut", "cat", "dog"])
     # Check that the some synonyms were generated
     assert len(synonyms) > 0
@@ -134,6 +146,14 @@ def test_cuda_synonym_generator():
     _check_synonym_generator("cuda")
 
 
+@pytest.mark.skipif(
+    total_memory < 12 or not torch.cuda.is_available() or total_disk_space < 25,
+    reason="Test requires at least 12GB of RAM, 25GB of HDD and CUDA support",
+)
+def test_cuda_4bit_synonym_generator():
+    _check_synonym_generator("cuda", quantization="4bit")
+
+
 @pytest.mark.skipif(
     total_memory < 32 or total_disk_space < 35,
     reason="Test requires at least 28GB of RAM and 35GB of HDD for running on CPU",